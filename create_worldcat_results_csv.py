@@ -45,14 +45,24 @@ tricky_titles = gather_worldcat_stats.tricky_titles
 
 for record_key in record_keys:
     title_record = neh_title_records[record_key]
-    worldcat_stats_for_record = worldcat_stats_dictionary[record_key]
 
     unique_identifier = record_key
     prefix = title_record["Prefix"]
     title = title_record["Title"]
     subtitle = title_record["Subtitle"]
 
-    if len(worldcat_stats_for_record.keys()) == 0:
+    # Titles deferred by a request plan (or not reached before the API limit) have no entry in worldcat_stats yet
+    if record_key not in worldcat_stats_dictionary:
+        isbn_or_oclc = "Not yet gathered"
+        identifiers_searched = "N/A"
+        oclc_collection_method = "N/A"
+        bibliographic_frbr_grouping = "N/A"
+        library_frbr_grouping = "N/A"
+        records_found = "N/A"
+        number_of_libraries = ""
+        country_distribution = ""
+        region_csv_values = []
+    elif len(worldcat_stats_dictionary[record_key].keys()) == 0:
         isbn_or_oclc = "Record excluded from analysis"
         identifiers_searched = "N/A"
         oclc_collection_method = "N/A"
@@ -63,6 +73,7 @@ for record_key in record_keys:
         country_distribution = ""
         region_csv_values = []
     else:
+        worldcat_stats_for_record = worldcat_stats_dictionary[record_key]
         isbn_or_oclc = worldcat_stats_for_record["Identifier Type Used for Data Collection"]
         if isbn_or_oclc == "ISBN":
             identifiers_searched = "; ".join(worldcat_stats_for_record["ISBNs Searched"])
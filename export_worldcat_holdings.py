@@ -0,0 +1,137 @@
+## Script for Exporting WorldCat Library Holdings as Flat Tables
+## export_worldcat_holdings.py
+
+## Refer to read_me.txt in the worldcat_analysis directory for an explanation of the script and its dependencies.
+## Main Program starts on line 87
+
+import json
+import csv
+import gather_worldcat_stats
+
+# pyarrow is optional; without it, the tables are written as CSV files instead of Parquet files
+try:
+    import pyarrow
+    import pyarrow.parquet
+except ImportError:
+    pyarrow = None
+
+## Functions
+
+# Creates a dictionary of empty column lists for a table with the given column names
+def create_empty_table(column_names):
+    table = {}
+    for column_name in column_names:
+        table[column_name] = []
+    return table
+
+# Adds the values for one row to each of a table's column lists
+def add_row_to_table(table, row_values):
+    for column_name in table:
+        table[column_name].append(row_values[column_name])
+
+# Writes a table to a Parquet file when pyarrow is installed, or to a CSV file otherwise, and returns the name of the file written
+def write_table(table, file_name_base):
+    if pyarrow != None:
+        file_name = file_name_base + ".parquet"
+        pyarrow.parquet.write_table(pyarrow.table(table), file_name)
+    else:
+        file_name = file_name_base + ".csv"
+        table_open = open(file_name, "w", encoding="utf-8", newline='')
+        csvwriter = csv.writer(table_open, delimiter=",", quoting=csv.QUOTE_MINIMAL)
+        column_names = list(table.keys())
+        csvwriter.writerow(column_names)
+        csvwriter.writerows(zip(*[table[column_name] for column_name in column_names]))
+        table_open.close()
+    return file_name
+
+# Creates the identifiers searched value for the title summary table from a worldcat_stats record
+def find_identifiers_searched(worldcat_stats_for_record):
+    isbn_or_oclc = worldcat_stats_for_record["Identifier Type Used for Data Collection"]
+    if isbn_or_oclc == "ISBN":
+        identifiers_searched = "; ".join(worldcat_stats_for_record["ISBNs Searched"])
+    elif isbn_or_oclc == "OCLC":
+        identifiers_searched = "; ".join(worldcat_stats_for_record["OCLC Numbers Searched"])
+    else:
+        identifiers_searched = ""
+    return identifiers_searched
+
+# Converts the Library Locations FRBR Grouping value stored in worldcat_stats (true, false, or "N/A") to the "TRUE"/"FALSE"/"N/A" strings
+# used in tricky_titles.csv and worldcat_analysis_results.csv
+def convert_frbr_value_to_string(frbr_value):
+    if frbr_value == True:
+        frbr_string = "TRUE"
+    elif frbr_value == False:
+        frbr_string = "FALSE"
+    else:
+        frbr_string = "N/A"
+    return frbr_string
+
+## Initializing Variables
+
+worldcat_stats_file = open(gather_worldcat_stats.WORLDCAT_STATS_FNAME, "r", encoding="utf-8")
+worldcat_stats_dictionary = json.loads(worldcat_stats_file.read())
+worldcat_stats_file.close()
+
+# Regions used for the region count columns of the title summary table, paired with the column names
+regions = {"Africa": "libraries_africa",
+           "Asia & Pacific": "libraries_asia_pacific",
+           "Arab States": "libraries_arab_states",
+           "Europe": "libraries_europe",
+           "North America": "libraries_north_america",
+           "South/Latin America": "libraries_south_latin_america",
+           "Unknown": "libraries_location_unknown"}
+
+HOLDINGS_FNAME_BASE = "outputs/worldcat_holdings"
+TITLE_SUMMARY_FNAME_BASE = "outputs/worldcat_title_summary"
+
+## Main Program
+
+holdings_table = create_empty_table(["title_key", "identifier", "oclc_symbol", "country", "region"])
+title_summary_table = create_empty_table(["title_key", "identifier_type", "identifiers_searched", "library_frbr_grouping", "number_of_libraries"] +
+                                         list(regions.values()))
+
+for title_key in worldcat_stats_dictionary:
+    worldcat_stats_for_record = worldcat_stats_dictionary[title_key]
+    # Records excluded from analysis are stored as empty dictionaries and are left out of both tables
+    if len(worldcat_stats_for_record.keys()) == 0:
+        continue
+
+    # Entries stored in an older format lack library identifiers; rerunning gather_worldcat_stats.py recomputes them
+    if "Library Identifiers" not in worldcat_stats_for_record.keys():
+        print("*** #{} has no library identifiers; rerun gather_worldcat_stats.py to recompute it ***".format(title_key))
+        library_identifiers = {}
+    else:
+        library_identifiers = worldcat_stats_for_record["Library Identifiers"]
+
+    for library in worldcat_stats_for_record["Complete Library Data"]:
+        region = gather_worldcat_stats.find_region_for_country(library["country"])
+        if region == None:
+            region = ""
+        if library["oclcSymbol"] in library_identifiers:
+            identifier = library_identifiers[library["oclcSymbol"]]
+        else:
+            identifier = ""
+        add_row_to_table(holdings_table, {"title_key": title_key,
+                                          "identifier": identifier,
+                                          "oclc_symbol": library["oclcSymbol"],
+                                          "country": library["country"],
+                                          "region": region})
+
+    summary_row = {"title_key": title_key,
+                   "identifier_type": worldcat_stats_for_record["Identifier Type Used for Data Collection"],
+                   "identifiers_searched": find_identifiers_searched(worldcat_stats_for_record),
+                   "library_frbr_grouping": convert_frbr_value_to_string(worldcat_stats_for_record["Library Locations - FRBR Grouping"]),
+                   "number_of_libraries": len(worldcat_stats_for_record["Complete Library Data"])}
+    if worldcat_stats_for_record["Data Summary"] != "N/A":
+        region_counts = worldcat_stats_for_record["Data Summary"]["Region Distribution"]
+    else:
+        region_counts = {}
+    for region in regions:
+        if region in region_counts:
+            summary_row[regions[region]] = region_counts[region]
+        else:
+            summary_row[regions[region]] = 0
+    add_row_to_table(title_summary_table, summary_row)
+
+print("Holdings table written to " + write_table(holdings_table, HOLDINGS_FNAME_BASE))
+print("Title summary table written to " + write_table(title_summary_table, TITLE_SUMMARY_FNAME_BASE))
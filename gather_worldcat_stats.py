@@ -2,12 +2,14 @@
 ## gather_worldcat_stats.py
 
 ## Refer to read_me.txt in the worldcat_analysis directory for an explanation of the script and its dependencies.
-## Main Program starts on line 486
+## Main Program starts on line 614
 
 import string
 import csv
 import requests
 import json
+import hashlib
+from collections import Counter
 from bs4 import BeautifulSoup
 
 import codecs
@@ -44,18 +46,28 @@ def make_unique_request_string(base_url, params_diction, private_keys=["wskey"])
 # Makes the request and caches the new data, or retrieves the cached data; handles both API interaction and gathering HTML from the Web
 def make_request_using_cache(url, params=None):
     global problematic_json_snippets
+    global cache_keys_used
+    global requests_made
+    global daily_request_quota
     if params != None:
         cache_url = make_unique_request_string(url, params)
     else:
         cache_url = url
+    cache_keys_used.append(cache_url)
     if cache_url in CACHE_DICTION.keys():
         # print("Retrieving cached data...")
         return CACHE_DICTION[cache_url]
     else:
         # For requests to WorldCat Search API
         if params != None:
+            # Treating the daily request quota as the API limit, so the main program stops before any request over the quota is made
+            if requests_made >= daily_request_quota:
+                message = "Reached API limit"
+                print("Reached daily request quota")
+                return message
             # print("Making a request for new data...")
             response = requests.get(url, params)
+            requests_made += 1
             if response.status_code == 403:
                 message = "Reached API limit"
                 print(message)
@@ -94,27 +106,33 @@ def create_metadata_dictionary(data):
         metadata_dict["ISBN"] = data["ISBN"]
     return metadata_dict
 
-# Constructs a URL and dictionary of parameters, passes those to the make_request_using_cache function, and, when records are found
-# corresponding to an identifier (ISBN or OCLC number), combines the library results from multiple requests and returns the data in
-# a neat format.
-def collect_data_for_title(identifier, isbn_or_oclc, frbr_grouping=True):
+# Constructs the URL and dictionary of parameters for the first page of a Library Locations request for an identifier (ISBN or OCLC number)
+def create_library_locations_request(identifier, isbn_or_oclc, frbr_grouping=True):
     global worldcat_search_api_key
-    global not_found_uri
 
     base_url = "http://www.worldcat.org/webservices/catalog/content/libraries/"
     if isbn_or_oclc == "isbn":
         base_url += "isbn/{}?".format(identifier)
     elif isbn_or_oclc == "oclc":
         base_url += "{}?".format(identifier)
-    library_index = 1
-    message = None
     params = {"wskey": worldcat_search_api_key,
               "format":"json",
               "servicelevel": "default",
               "maximumLibraries": "100",
-              "startLibrary": int(library_index)}
+              "startLibrary": 1}
     if frbr_grouping == False:
         params["frbrGrouping"] = "off"
+    return (base_url, params)
+
+# Constructs a URL and dictionary of parameters, passes those to the make_request_using_cache function, and, when records are found
+# corresponding to an identifier (ISBN or OCLC number), combines the library results from multiple requests and returns the data in
+# a neat format.
+def collect_data_for_title(identifier, isbn_or_oclc, frbr_grouping=True):
+    global not_found_uri
+
+    base_url, params = create_library_locations_request(identifier, isbn_or_oclc, frbr_grouping)
+    library_index = 1
+    message = None
 
     library_dictionaries = []
     more_records = True
@@ -162,12 +180,14 @@ def collect_data_for_title(identifier, isbn_or_oclc, frbr_grouping=True):
     metadata["Number of Libraries"] = len(library_dictionaries)
     return (metadata, library_dictionaries)
 
-# Coordinates requests for each identifier, handles normal and problematic results, and then combines data associated with all identifiers
+# Coordinates requests for each identifier, handles normal and problematic results, and then combines data associated with all identifiers;
+# also records, for each library's OCLC symbol, the first identifier whose search returned that library
 def collect_libraries_for_identifiers(identifiers, isbn_or_oclc, frbr_grouping=True):
     at_api_limit = False
     identifiers_searched = []
     metadata_dictionaries = {}
     all_libraries_for_title = []
+    library_identifiers = {}
     for identifier in identifiers:
         result = collect_data_for_title(identifier, isbn_or_oclc, frbr_grouping)
         identifiers_searched.append(identifier)
@@ -182,11 +202,13 @@ def collect_libraries_for_identifiers(identifiers, isbn_or_oclc, frbr_grouping=T
             metadata_dictionaries[identifier] = metadata
             libraries = result[1]
             all_libraries_for_title += libraries
-    return (identifiers_searched, metadata_dictionaries, all_libraries_for_title, at_api_limit)
+            for library in libraries:
+                if library["oclcSymbol"] not in library_identifiers:
+                    library_identifiers[library["oclcSymbol"]] = identifier
+    return (identifiers_searched, metadata_dictionaries, all_libraries_for_title, at_api_limit, library_identifiers)
 
-# Uses the Bibliographic Resource tool to search for records, parses the returned MARC XML, and then returns a list of matching OCLC numbers and
-# additional metadata for validation purposes
-def look_up_record_for_oclc_numbers(title_dictionary, title_key, frbr_grouping=True):
+# Constructs the URL and dictionary of parameters for a Bibliographic Resource (SRU) search using a title record's title and subtitle
+def create_bibliographic_resource_request(title_dictionary, frbr_grouping=True):
     global worldcat_search_api_key
     base_url = 'http://www.worldcat.org/webservices/catalog/search/sru?'
 
@@ -201,6 +223,12 @@ def look_up_record_for_oclc_numbers(title_dictionary, title_key, frbr_grouping=T
               "maximumRecords": 100}
     if frbr_grouping == False:
         params["frbrGrouping"] = "off"
+    return (base_url, params)
+
+# Uses the Bibliographic Resource tool to search for records, parses the returned MARC XML, and then returns a list of matching OCLC numbers and
+# additional metadata for validation purposes
+def look_up_record_for_oclc_numbers(title_dictionary, title_key, frbr_grouping=True):
+    base_url, params = create_bibliographic_resource_request(title_dictionary, frbr_grouping)
     result = make_request_using_cache(base_url, params)
     if result == "Reached API limit":
         return result
@@ -254,6 +282,14 @@ def look_up_record_for_oclc_numbers(title_dictionary, title_key, frbr_grouping=T
                                                          "MARC Series": marc_values_dict["Series"]}
     return oclc_matches
 
+# Creates a list of the ISBNs in a title record that can be searched using the Library Locations service
+def find_isbns_for_title(title_record):
+    isbns = []
+    for isbn_field in ["HC ISBN", "PB ISBN", "EB ISBN", "EB (OA) ISBN"]:
+        if title_record[isbn_field] not in ["", "PB Only", "Paper Only", "See rights column", "N/A", "Not Available"]:
+            isbns.append(title_record[isbn_field])
+    return isbns
+
 # Takes a CSV string and converts it to a Python Boolean value; for processing FRBR instructions in tricky_titles.csv
 def convert_frbr_string_to_boolean(string):
     if string == "TRUE":
@@ -370,12 +406,12 @@ def check_for_metadata_match(title_dictionary, metadata_dictionaries):
 
 # Iterates through a list of libraries and creates a new list of libraries with any duplicates removed
 def find_libraries_without_duplicates(library_list):
-    library_symbols = []
+    library_symbols = set()
     libraries_without_duplicates = []
     for library in library_list:
         symbol = library["oclcSymbol"]
         if symbol not in library_symbols:
-            library_symbols.append(symbol)
+            library_symbols.add(symbol)
             libraries_without_duplicates.append(library)
     return libraries_without_duplicates
 
@@ -395,43 +431,106 @@ def create_country_to_region_dictionary():
             country_to_region_dictionary[country] = region
     return country_to_region_dictionary
 
+# Looks up the region for a country listed in a library record, returning "Unknown" when no country was provided and None when the country
+# is not in the country to region conversion dictionary
+def find_region_for_country(library_country):
+    global country_to_region_dictionary
+    weird_case_conversion_dict = {"Viet Nam": "Vietnam", "Macao": "Macau"}
+    if library_country in weird_case_conversion_dict.keys():
+        country = weird_case_conversion_dict[library_country]
+    else:
+        country = library_country
+    if country in country_to_region_dictionary.keys():
+        region = country_to_region_dictionary[country]
+    elif country == "":
+        region = "Unknown"
+    else:
+        region = None
+    return region
+
 # Creates a dictionary for each title record that counts the number of libraries found and determines their distribution by country and region
 def perform_basic_analysis(libraries):
-    global country_to_region_dictionary
     data_summary_dict = {}
 
     data_summary_dict["Number of Libraries"] = len(libraries)
 
-    countries_represented = {}
-    for library in libraries:
-        if library["country"] not in countries_represented:
-            countries_represented[library["country"]] = 0
-        countries_represented[library["country"]] += 1
+    countries_represented = dict(Counter(library["country"] for library in libraries))
     data_summary_dict["Country Distribution"] = countries_represented
 
+    # Region counts are built from the country counts, so each country is only looked up once
     region_counts = {}
-    weird_case_conversion_dict = {"Viet Nam": "Vietnam", "Macao": "Macau"}
-    for library in libraries:
-        if library["country"] in weird_case_conversion_dict.keys():
-            country = weird_case_conversion_dict[library["country"]]
-        else:
-            country = library["country"]
-        if country in country_to_region_dictionary.keys():
-            region = country_to_region_dictionary[country]
+    for library_country in countries_represented:
+        region = find_region_for_country(library_country)
+        if region != None:
             if region not in region_counts:
                 region_counts[region] = 0
-            region_counts[region] += 1
+            region_counts[region] += countries_represented[library_country]
         else:
-            if country == "":
-                if "Unknown" not in region_counts.keys():
-                    region_counts["Unknown"] = 0
-                region_counts["Unknown"] += 1
-            else:
-                print("*** {} not found in country to region conversion dictionary ***".format(library["country"]))
+            print("*** {} not found in country to region conversion dictionary ***".format(library_country))
     data_summary_dict["Region Distribution"] = region_counts
 
     return data_summary_dict
 
+## Functions for tracking changes to title inputs between runs
+
+# Creates a hash of the inputs used to gather data for a title (the title record, its row in tricky_titles.csv, its FRBR settings,
+# whether it is excluded from analysis, the cached responses it relied on, and the country to region lookup used for its Data Summary)
+# and the version of the worldcat_stats entry format, so reruns can tell whether the title needs to be recomputed
+def create_input_hash_for_title(title_key, cache_keys):
+    global WORLDCAT_STATS_FORMAT_VERSION
+    global neh_title_records
+    global tricky_titles
+    global problematic_record_keys
+    global country_to_region_dictionary
+
+    if title_key in tricky_titles:
+        tricky_title = tricky_titles[title_key]
+        frbr_settings = {"Bibliographic Resource": tricky_title["Bibliographic Resource - FRBR Grouping"],
+                         "Library Locations": tricky_title["Library Locations - FRBR Grouping"]}
+    else:
+        tricky_title = "N/A"
+        frbr_settings = {"Bibliographic Resource": "TRUE", "Library Locations": "TRUE"}
+
+    cached_responses = {}
+    for cache_key in cache_keys:
+        if cache_key in CACHE_DICTION.keys():
+            cached_responses[cache_key] = CACHE_DICTION[cache_key]
+        else:
+            cached_responses[cache_key] = None
+
+    title_inputs = {"Stats Format Version": WORLDCAT_STATS_FORMAT_VERSION,
+                    "Title Record": neh_title_records[title_key],
+                    "Tricky Title": tricky_title,
+                    "FRBR Settings": frbr_settings,
+                    "Problematic Record": title_key in problematic_record_keys,
+                    "Cached Responses": cached_responses,
+                    "Country to Region Dictionary": country_to_region_dictionary}
+    inputs_string = json.dumps(title_inputs, sort_keys=True)
+    return hashlib.sha256(inputs_string.encode("utf-8")).hexdigest()
+
+# Compares the current hash of a title's inputs to the one stored during the previous run; titles without a stored hash count as changed
+def check_for_unchanged_inputs(title_key, previous_input_hashes):
+    if title_key not in previous_input_hashes.keys():
+        unchanged = False
+    else:
+        previous_hash_dictionary = previous_input_hashes[title_key]
+        current_hash = create_input_hash_for_title(title_key, previous_hash_dictionary["Cache Keys"])
+        if current_hash == previous_hash_dictionary["Input Hash"]:
+            unchanged = True
+        else:
+            unchanged = False
+    return unchanged
+
+# Loads a JSON file written by a previous run, returning an empty dictionary if the file does not exist yet
+def load_previous_run_file(file_name):
+    try:
+        previous_file = open(file_name, "r", encoding="utf-8")
+        previous_contents = json.loads(previous_file.read())
+        previous_file.close()
+    except:
+        previous_contents = {}
+    return previous_contents
+
 ### Initializing Variables
 
 global worldcat_search_api_key
@@ -447,6 +546,16 @@ problematic_json_snippets = ['"Mario Gattullo"', '"Lucian Blaga"', '"Antonio Pig
 global not_found_uri
 not_found_uri = "info:srw/diagnostic/1/65"
 
+# The cache_keys_used variable collects the cache keys requested while gathering data for the current title; the main program resets it
+# for each title and stores the keys with the title's input hash
+global cache_keys_used
+cache_keys_used = []
+
+# The requests_made variable counts the requests for new data made to the WorldCat Search API during this run, so make_request_using_cache
+# can refuse to make requests over the daily request quota
+global requests_made
+requests_made = 0
+
 global country_to_region_dictionary
 country_to_region_dictionary = create_country_to_region_dictionary()
 
@@ -483,6 +592,25 @@ records_file.close()
 # Variable that allows the script's user to control up to what record to gather data for
 last_record_number = 372
 
+# Files storing the gathered data and the hashes of each title's inputs; hashes from a previous run are used to only recompute
+# titles whose inputs have changed
+WORLDCAT_STATS_FNAME = "outputs/worldcat_stats.json"
+INPUT_HASHES_FNAME = "outputs/worldcat_input_hashes.json"
+
+# Version of the layout of worldcat_stats entries and of the analysis that produces them; it is included in each title's input hash, so it
+# must be increased whenever the entry keys, perform_basic_analysis, or the way library data is gathered change, to force stored entries
+# to be recomputed
+global WORLDCAT_STATS_FORMAT_VERSION
+WORLDCAT_STATS_FORMAT_VERSION = 1
+
+# Maximum number of new API requests to make in a single run; plan_worldcat_requests.py also uses this value as the budget for its request plan
+daily_request_quota = 50000
+
+# Variables that control whether the main program follows the request plan created by plan_worldcat_requests.py, gathering data only for
+# the planned titles, in the planned order, instead of for every title up to last_record_number
+REQUEST_PLAN_FNAME = "outputs/worldcat_request_plan.json"
+use_request_plan = False
+
 ### Main Program
 
 if __name__ == "__main__":
@@ -490,17 +618,42 @@ if __name__ == "__main__":
     print("*** WorldCat Analysis Script for NEH/Mellon HOB Asian Studies Project ***")
 
     worldcat_stats = {}
+    input_hashes = {}
+    recomputed_keys = []
     at_api_limit = False
     no_records_found = []
     match_issues = []
     title_keys = list(neh_title_records.keys())
 
-    for title_key in title_keys[:last_record_number]:
+    previous_worldcat_stats = load_previous_run_file(WORLDCAT_STATS_FNAME)
+    previous_input_hashes = load_previous_run_file(INPUT_HASHES_FNAME)
+
+    if use_request_plan == True:
+        request_plan = load_previous_run_file(REQUEST_PLAN_FNAME)
+        if "Planned Title Keys" not in request_plan.keys():
+            print("No request plan found at {}. Run plan_worldcat_requests.py first.".format(REQUEST_PLAN_FNAME))
+            print("Stopping program...")
+            sys.exit(1)
+        title_keys_to_gather = request_plan["Planned Title Keys"]
+    else:
+        title_keys_to_gather = title_keys[:last_record_number]
+
+    for title_key in title_keys_to_gather:
         print("*** #{} ***".format(title_key))
         if at_api_limit == True:
             print("Stopping program...")
             break
+        elif title_key in previous_worldcat_stats and check_for_unchanged_inputs(title_key, previous_input_hashes):
+            print("Inputs unchanged; using stored results")
+            worldcat_stats[title_key] = previous_worldcat_stats[title_key]
+            input_hashes[title_key] = previous_input_hashes[title_key]
+            if title_key not in problematic_record_keys:
+                if worldcat_stats[title_key]["Match Check"] != "N/A" and worldcat_stats[title_key]["Match Check"][0] == False:
+                    match_issues.append(title_key)
+                if len(worldcat_stats[title_key]["Complete Library Data"]) == 0:
+                    no_records_found.append(title_key)
         else:
+            cache_keys_used.clear()
             if title_key in problematic_record_keys:
                 worldcat_stats[title_key] = {}
             else:
@@ -509,10 +662,7 @@ if __name__ == "__main__":
                     skip_isbn = True
                 else:
                     skip_isbn = False
-                    isbns = []
-                    for isbn_field in ["HC ISBN", "PB ISBN", "EB ISBN", "EB (OA) ISBN"]:
-                        if title_record[isbn_field] not in ["", "PB Only", "Paper Only", "See rights column", "N/A", "Not Available"]:
-                            isbns.append(title_record[isbn_field])
+                    isbns = find_isbns_for_title(title_record)
                     result = collect_libraries_for_identifiers(isbns, "isbn")
                     at_api_limit = result[3]
                     if at_api_limit == True:
@@ -521,6 +671,7 @@ if __name__ == "__main__":
                         isbns_searched = result[0]
                         metadata_dictionaries = result[1]
                         all_libraries = result[2]
+                        library_identifiers = result[4]
                 if skip_isbn == False and len(all_libraries) != 0:
                     match_check = check_for_metadata_match(title_record, metadata_dictionaries)
                     if match_check[0] == False:
@@ -533,7 +684,8 @@ if __name__ == "__main__":
                                                  "Library Locations - FRBR Grouping": True,
                                                  "Response Metadata": metadata_dictionaries,
                                                  "Match Check": match_check,
-                                                 "Complete Library Data": libraries_without_duplicates}
+                                                 "Complete Library Data": libraries_without_duplicates,
+                                                 "Library Identifiers": library_identifiers}
                 else:
                     if skip_isbn == True:
                         isbns_searched = ["Problems with the ISBN results were identified."]
@@ -565,7 +717,8 @@ if __name__ == "__main__":
                                                      "Library Locations - FRBR Grouping": "N/A",
                                                      "Response Metadata": "No results found using ISBNs or OCLC numbers",
                                                      "Match Check": "N/A",
-                                                     "Complete Library Data": []}
+                                                     "Complete Library Data": [],
+                                                     "Library Identifiers": {}}
                         no_records_found.append(title_key)
                     else:
                         if title_key in tricky_titles:
@@ -580,6 +733,7 @@ if __name__ == "__main__":
                             oclc_numbers_searched = result[0]
                             metadata_dictionaries = result[1]
                             all_libraries = result[2]
+                            library_identifiers = result[4]
                             libraries_without_duplicates = find_libraries_without_duplicates(all_libraries)
                             worldcat_stats[title_key] = {"Identifier Type Used for Data Collection": "OCLC",
                                                          "ISBNs Searched": isbns_searched,
@@ -588,12 +742,32 @@ if __name__ == "__main__":
                                                          "Library Locations - FRBR Grouping": frbr_grouping_library,
                                                          "Response Metadata": metadata_dictionaries,
                                                          "Match Check": "N/A",
-                                                         "Complete Library Data": libraries_without_duplicates}
+                                                         "Complete Library Data": libraries_without_duplicates,
+                                                         "Library Identifiers": library_identifiers}
                             if len(all_libraries) == 0:
                                 no_records_found.append(title_key)
+            if title_key in worldcat_stats:
+                title_cache_keys = sorted(set(cache_keys_used))
+                input_hashes[title_key] = {"Input Hash": create_input_hash_for_title(title_key, title_cache_keys),
+                                           "Cache Keys": title_cache_keys}
+                recomputed_keys.append(title_key)
 
-    # Adding dictionary with basic analysis to each worldcat_stats record with library dictionaries
-    for key in worldcat_stats:
+    # Carrying over stored results for titles not reached during this run (e.g. because of the API limit) whose inputs are unchanged
+    for title_key in title_keys[:last_record_number]:
+        if title_key not in worldcat_stats and title_key in previous_worldcat_stats:
+            if check_for_unchanged_inputs(title_key, previous_input_hashes):
+                worldcat_stats[title_key] = previous_worldcat_stats[title_key]
+                input_hashes[title_key] = previous_input_hashes[title_key]
+
+    # Putting titles back in their original order, since a request plan may have gathered them out of order
+    ordered_worldcat_stats = {}
+    for title_key in title_keys:
+        if title_key in worldcat_stats:
+            ordered_worldcat_stats[title_key] = worldcat_stats[title_key]
+    worldcat_stats = ordered_worldcat_stats
+
+    # Adding dictionary with basic analysis to each recomputed worldcat_stats record with library dictionaries
+    for key in recomputed_keys:
         if key not in problematic_record_keys:
             libraries_found_for_title = worldcat_stats[key]["Complete Library Data"]
             if len(libraries_found_for_title) != 0:
@@ -602,13 +776,20 @@ if __name__ == "__main__":
                 worldcat_stats[key]["Data Summary"] = "N/A"
 
     # Storing data gathered from WorldCat in a JSON file
-    worldcat_stats_file = open("outputs/worldcat_stats.json", "w", encoding="utf-8")
+    worldcat_stats_file = open(WORLDCAT_STATS_FNAME, "w", encoding="utf-8")
     worldcat_stats_file.write(json.dumps(worldcat_stats, indent=4))
     worldcat_stats_file.close()
 
+    # Storing the input hashes for each title so the next run can skip titles whose inputs have not changed
+    input_hashes_file = open(INPUT_HASHES_FNAME, "w", encoding="utf-8")
+    input_hashes_file.write(json.dumps(input_hashes, indent=4))
+    input_hashes_file.close()
+
     print("\n")
 
     ## Data testing
     print("*** Data testing ***")
     print("Records with match issues: " + str(len(match_issues)))
     print("Records with no results: " + str(len(no_records_found)))
+    print("Records recomputed: " + str(len(recomputed_keys)))
+    print("New API requests made: " + str(requests_made))
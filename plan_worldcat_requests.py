@@ -0,0 +1,151 @@
+## Script for Planning WorldCat Search API Requests Within the Daily Quota
+## plan_worldcat_requests.py
+
+## Refer to read_me.txt in the worldcat_analysis directory for an explanation of the script and its dependencies.
+## Main Program starts on line 133
+
+import json
+import gather_worldcat_stats
+
+## Functions
+
+# Walks the cached Library Locations pages for an identifier (ISBN or OCLC number) the same way collect_data_for_title requests them, and
+# returns the estimated number of uncached pages along with the number of libraries found (None if that depends on uncached pages); when
+# only a continuation page is missing, the libraries already found are kept and a single remaining page is budgeted
+def estimate_library_locations_pages(identifier, isbn_or_oclc, frbr_grouping=True):
+    base_url, params = gather_worldcat_stats.create_library_locations_request(identifier, isbn_or_oclc, frbr_grouping)
+    library_index = 1
+    number_of_libraries = 0
+    while True:
+        params["startLibrary"] = library_index
+        cache_key = gather_worldcat_stats.make_unique_request_string(base_url, params)
+        if cache_key not in gather_worldcat_stats.CACHE_DICTION.keys():
+            if library_index == 1:
+                return (estimated_pages_per_uncached_identifier, None)
+            else:
+                return (1, number_of_libraries)
+        data = gather_worldcat_stats.CACHE_DICTION[cache_key]
+        if "diagnostic" in data.keys() or "diagnostics" in data.keys():
+            return (0, 0)
+        elif "diagnostic" in data["library"][0].keys():
+            # Either no records were found or the previous page was the last one
+            return (0, number_of_libraries)
+        else:
+            number_of_libraries += len(data["library"])
+        library_index += 100
+
+# Checks whether the Bibliographic Resource search for a title is cached; if it is, the matching OCLC numbers are read from the cache,
+# and if not, one SRU query is needed and the OCLC numbers are unknown (None)
+def estimate_bibliographic_resource_query(title_key, frbr_grouping=True):
+    title_record = gather_worldcat_stats.neh_title_records[title_key]
+    base_url, params = gather_worldcat_stats.create_bibliographic_resource_request(title_record, frbr_grouping)
+    cache_key = gather_worldcat_stats.make_unique_request_string(base_url, params)
+    if cache_key in gather_worldcat_stats.CACHE_DICTION.keys():
+        oclc_matches = gather_worldcat_stats.look_up_record_for_oclc_numbers(title_record, title_key, frbr_grouping=frbr_grouping)
+        return (0, list(oclc_matches["OCLC Numbers"].keys()))
+    else:
+        return (1, None)
+
+# Estimates the number of uncached Library Locations pages and SRU queries the main program of gather_worldcat_stats.py will need for
+# a title, following the same ISBN, OCLC number, and tricky title paths; titles whose OCLC numbers depend on an uncached Bibliographic
+# Resource search are marked as unbounded, since the search can return up to 100 OCLC numbers, each needing its own pages
+def estimate_requests_for_title(title_key):
+    tricky_titles = gather_worldcat_stats.tricky_titles
+    title_estimate = {"Library Locations Pages": 0, "SRU Queries": 0, "Unbounded": False}
+    if title_key in gather_worldcat_stats.problematic_record_keys:
+        return title_estimate
+
+    if title_key not in tricky_titles:
+        isbns = gather_worldcat_stats.find_isbns_for_title(gather_worldcat_stats.neh_title_records[title_key])
+        no_libraries_found = True
+        for isbn in isbns:
+            uncached_pages, number_of_libraries = estimate_library_locations_pages(isbn, "isbn")
+            title_estimate["Library Locations Pages"] += uncached_pages
+            # Titles with uncached ISBN pages are assumed to find libraries and not need the OCLC number path
+            if number_of_libraries != 0:
+                no_libraries_found = False
+        if no_libraries_found == False:
+            return title_estimate
+
+    if title_key in tricky_titles and tricky_titles[title_key]["Bibliographic/Manual"] == "Manual":
+        oclc_numbers = tricky_titles[title_key]["OCLC Numbers"]
+    else:
+        if title_key in tricky_titles:
+            frbr_grouping_bib = gather_worldcat_stats.convert_frbr_string_to_boolean(tricky_titles[title_key]["Bibliographic Resource - FRBR Grouping"])
+        else:
+            frbr_grouping_bib = True
+        uncached_queries, oclc_numbers = estimate_bibliographic_resource_query(title_key, frbr_grouping_bib)
+        title_estimate["SRU Queries"] += uncached_queries
+
+    if title_key in tricky_titles:
+        frbr_grouping_library = gather_worldcat_stats.convert_frbr_string_to_boolean(tricky_titles[title_key]["Library Locations - FRBR Grouping"])
+    else:
+        frbr_grouping_library = True
+    if oclc_numbers == None:
+        title_estimate["Unbounded"] = True
+    else:
+        for oclc_number in oclc_numbers:
+            uncached_pages, number_of_libraries = estimate_library_locations_pages(oclc_number, "oclc", frbr_grouping_library)
+            title_estimate["Library Locations Pages"] += uncached_pages
+    return title_estimate
+
+# Orders titles from cheapest to most expensive (keeping the original order for titles with the same estimate), with unbounded titles last,
+# and then plans titles in that order until one does not fit within the request budget, deferring the rest to a later run; for unbounded
+# titles, only the requests known in advance count against the budget
+def create_request_plan(title_estimates, request_budget):
+    title_costs = {}
+    for title_key in title_estimates:
+        title_costs[title_key] = title_estimates[title_key]["Library Locations Pages"] + title_estimates[title_key]["SRU Queries"]
+    title_keys_by_cost = sorted(title_costs.keys(), key=lambda x: (title_estimates[x]["Unbounded"], title_costs[x]))
+
+    planned_title_keys = []
+    deferred_title_keys = []
+    estimated_requests = 0
+    budget_used_up = False
+    for title_key in title_keys_by_cost:
+        # Once a title does not fit, all later (more expensive or unbounded) titles are deferred as well
+        if budget_used_up == False and estimated_requests + title_costs[title_key] <= request_budget:
+            planned_title_keys.append(title_key)
+            estimated_requests += title_costs[title_key]
+        else:
+            budget_used_up = True
+            deferred_title_keys.append(title_key)
+
+    unbounded_title_keys = []
+    for title_key in planned_title_keys:
+        if title_estimates[title_key]["Unbounded"] == True:
+            unbounded_title_keys.append(title_key)
+
+    request_plan = {"Daily Request Quota": request_budget,
+                    "Estimated Requests": estimated_requests,
+                    "Planned Title Keys": planned_title_keys,
+                    "Unbounded Title Keys": unbounded_title_keys,
+                    "Deferred Title Keys": deferred_title_keys,
+                    "Title Estimates": title_estimates}
+    return request_plan
+
+## Initializing Variables
+
+# Number of pages to budget when a Library Locations page for an identifier is not cached; a search that finds libraries takes at least
+# two pages (the libraries, then an empty "First position out of range" page)
+estimated_pages_per_uncached_identifier = 2
+
+## Main Program
+
+title_keys = list(gather_worldcat_stats.neh_title_records.keys())[:(gather_worldcat_stats.last_record_number)]
+
+title_estimates = {}
+for title_key in title_keys:
+    title_estimates[title_key] = estimate_requests_for_title(title_key)
+
+request_plan = create_request_plan(title_estimates, gather_worldcat_stats.daily_request_quota)
+
+request_plan_file = open(gather_worldcat_stats.REQUEST_PLAN_FNAME, "w", encoding="utf-8")
+request_plan_file.write(json.dumps(request_plan, indent=4))
+request_plan_file.close()
+
+print("*** Request plan ***")
+print("Titles planned: " + str(len(request_plan["Planned Title Keys"])))
+print("Titles planned with unbounded estimates: " + str(len(request_plan["Unbounded Title Keys"])))
+print("Titles deferred: " + str(len(request_plan["Deferred Title Keys"])))
+print("Estimated requests (excluding unbounded titles' Library Locations pages): " + str(request_plan["Estimated Requests"]))